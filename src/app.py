@@ -1,36 +1,81 @@
 from fastapi import FastAPI
-from .transcription_service.core import TranscriptionService
+from fastapi.responses import ORJSONResponse
+from .transcription_service.core import get_service
 import os
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 
 # 导入配置和状态
-from .config.shared_state import service
+from .config.app_config import (
+    DEFAULT_MODEL_SIZE,
+    MAX_CONTENT_LENGTH,
+    MAX_INFLIGHT,
+    TEMP_POOL_SIZE,
+    RESULT_CACHE_PATH,
+    RESULT_CACHE_SIZE,
+)
 from .routes.transcription import router as transcription_router
+from .utils.result_cache import ResultCache
+from .utils.task_utils import _task_janitor
+from .utils.temp_pool import TempFilePool
+from .utils.upload_limit import InflightLimitMiddleware, UploadLimitMiddleware
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+async def _load_default_service(model_size: str):
+    """在后台加载并预热默认模型，与首个请求的上传过程重叠进行"""
+    from .config import shared_state
+
+    try:
+        service = await asyncio.to_thread(get_service, model_size)
+        logger.info(f"Transcription service initialized with {model_size} model")
+        await asyncio.to_thread(service.warmup)
+        shared_state.service = service
+    except Exception as e:
+        logger.error(f"Failed to initialize transcription service: {e}")
+    finally:
+        shared_state.service_ready.set()
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Handle startup and shutdown events"""
     from .config import shared_state
 
+    # 不等待模型加载完成，请求会在真正需要模型时等待就绪
+    load_task = asyncio.create_task(_load_default_service(DEFAULT_MODEL_SIZE))
+    shared_state.temp_pool = TempFilePool(TEMP_POOL_SIZE)
+    if RESULT_CACHE_SIZE > 0:
+        shared_state.result_cache = ResultCache(RESULT_CACHE_PATH, RESULT_CACHE_SIZE)
+    janitor_task = asyncio.create_task(_task_janitor())
+    cleanup_task = asyncio.create_task(shared_state.temp_pool.cleanup_worker())
     try:
-        model_size = os.getenv("WHISPER_MODEL_SIZE", "small")
-        shared_state.service = TranscriptionService(model_size=model_size)
-        logger.info(f"Transcription service initialized with {model_size} model")
         yield
-    except Exception as e:
-        logger.error(f"Failed to initialize transcription service: {e}")
-        raise
     finally:
-        pass
+        # 模型仍在加载时关闭服务，不再等待加载和预热完成
+        load_task.cancel()
+        janitor_task.cancel()
+        cleanup_task.cancel()
+        shared_state.temp_pool.close()
+        if shared_state.result_cache:
+            shared_state.result_cache.close()
+
 
+# 长音频的字幕列表较大，使用 orjson 序列化响应
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+# 在 ASGI 层限制上传大小，超限时不再接收剩余内容
+app.add_middleware(UploadLimitMiddleware, max_content_length=MAX_CONTENT_LENGTH)
+# 后台任务已满时在接收上传之前拒绝，后添加的中间件先执行
+app.add_middleware(
+    InflightLimitMiddleware,
+    paths=("/transcribe", "/transcribe/srt"),
+    max_inflight=MAX_INFLIGHT,
+)
 
-app = FastAPI(lifespan=lifespan)
 
 # 注册路由
 app.include_router(transcription_router)
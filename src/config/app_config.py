@@ -1,3 +1,27 @@
+import os
+import tempfile
+
 # 全局配置
-MAX_CONTENT_LENGTH = 100 * 1024 * 1024  # 100MB 限制
-ALLOWED_EXTENSIONS = {"mp3", "wav", "m4a", "ogg", "flac"}
+# 上传文件大小上限，默认 100MB
+MAX_CONTENT_LENGTH = int(os.getenv("MAX_CONTENT_LENGTH", 100 * 1024 * 1024))
+ALLOWED_EXTENSIONS = frozenset({"mp3", "wav", "m4a", "ogg", "flac"})
+# 同时进行的转录数量上限
+MAX_WORKERS = int(os.getenv("MAX_WORKERS", 4))
+# 上传音频临时文件池大小
+TEMP_POOL_SIZE = int(os.getenv("TEMP_POOL_SIZE", 2 * MAX_WORKERS))
+# 后台转录任务数量上限，超出时新的异步任务请求直接返回 503
+MAX_INFLIGHT = int(os.getenv("MAX_INFLIGHT", TEMP_POOL_SIZE))
+# 默认模型大小
+DEFAULT_MODEL_SIZE = os.getenv("WHISPER_MODEL_SIZE", "small")
+# 允许通过请求参数切换的模型大小，默认只允许默认模型，避免客户端触发额外的模型下载和淘汰
+ALLOWED_MODEL_SIZES = set(
+    os.getenv("ALLOWED_MODEL_SIZES", DEFAULT_MODEL_SIZE).split(",")
+)
+# 转录结果缓存，RESULT_CACHE_SIZE 为 0 时禁用
+RESULT_CACHE_PATH = os.getenv(
+    "RESULT_CACHE_PATH", os.path.join(tempfile.gettempdir(), "audio_to_srt_cache.db")
+)
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", 1000))
+# 任务存储上限，以及已结束任务未被取走时的保留时间（秒）
+MAX_TASKS = int(os.getenv("MAX_TASKS", 1024))
+TASK_TTL = int(os.getenv("TASK_TTL", 3600))
@@ -1,11 +1,19 @@
 # 共享状态和全局变量
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Set
 import asyncio
-from concurrent.futures import ProcessPoolExecutor
-import os
+from collections import OrderedDict
+
+from .app_config import MAX_WORKERS
 
 # 全局服务实例和任务存储
 service: Optional["TranscriptionService"] = None
-tasks: Dict[str, Dict[str, Any]] = {}
-tasks_lock = asyncio.Lock()
-executor = ProcessPoolExecutor(max_workers=int(os.getenv("MAX_WORKERS", 4)))
+service_ready = asyncio.Event()
+temp_pool: Optional["TempFilePool"] = None
+result_cache: Optional["ResultCache"] = None
+tasks: "OrderedDict[str, TaskState]" = OrderedDict()
+# 正在进行的转录，按音频缓存键索引，用于合并重复请求
+inflight: Dict[str, asyncio.Future] = {}
+# 尚未结束的后台转录任务，同时保持对任务的引用以免被回收
+background_tasks: Set[asyncio.Task] = set()
+# 限制同时进行的转录数量
+task_semaphore = asyncio.Semaphore(MAX_WORKERS)
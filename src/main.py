@@ -1,21 +1,37 @@
 import os
+import asyncio
+import shutil
 import requests
 import argparse
-from transcription_service.core import TranscriptionService
-from config import shared_state
+import threading
+from concurrent.futures import Future
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from .transcription_service.core import get_service
+
+# 下载音频时的写入块大小
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+
+# 复用连接的下载会话，连接失败时自动重试
+_session = requests.Session()
+_adapter = HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=16,
+    max_retries=Retry(total=3, backoff_factor=0.5),
+)
+_session.mount("http://", _adapter)
+_session.mount("https://", _adapter)
 
 
-# download_audio 函数保持不变，但移到 transcription_service.py 中
-# 为了保持兼容性，这里保留原函数
 def download_audio(url, output_path):
     """下载音频文件"""
     try:
-        response = requests.get(url, stream=True)
-        response.raise_for_status()
-        with open(output_path, "wb") as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
+        with _session.get(url, stream=True, timeout=(5, 60)) as response:
+            response.raise_for_status()
+            # 让 urllib3 处理 gzip 等传输编码，再按 1MiB 块直接写入文件
+            response.raw.decode_content = True
+            with open(output_path, "wb") as f:
+                shutil.copyfileobj(response.raw, f, length=DOWNLOAD_CHUNK_SIZE)
         print(f"音频文件已下载到 {output_path}")
         return True
     except Exception as e:
@@ -23,24 +39,6 @@ def download_audio(url, output_path):
         return False
 
 
-# audio_to_srt 功能已迁移到 TranscriptionService 类
-# 为了保持向后兼容性，提供一个包装函数
-def audio_to_srt(audio_path, output_srt_path, language=None):
-    """将音频转换为 SRT 字幕，支持自动语言检测"""
-    try:
-        # 使用全局服务实例
-        if not shared_state.service:
-            raise Exception("转录服务未初始化")
-        # 执行转录并保存为SRT
-        success = shared_state.service.transcribe_to_srt(
-            audio_path, output_srt_path, language
-        )
-        return success
-    except Exception as e:
-        print(f"转录或生成字幕失败: {e}")
-        return False
-
-
 def main():
     """命令行入口点"""
     # 设置命令行参数
@@ -57,42 +55,52 @@ def main():
     )
     args = parser.parse_args()
 
-    # 初始化转录服务
-    if not shared_state.service:
-        try:
-            shared_state.service = TranscriptionService(model_size=args.model)
-            print(f"转录服务已初始化，使用 {args.model} 模型")
-        except Exception as e:
-            print(f"转录服务初始化失败: {e}")
-            return
-
     # 处理音频路径
     audio_path = args.audio
     output_srt_path = args.output
     is_url = audio_path.startswith(("http://", "https://"))
 
+    # 检查本地音频文件是否存在
+    if not is_url and not os.path.exists(audio_path):
+        print(f"错误：音频文件 {audio_path} 不存在")
+        return
+
+    # 在后台守护线程中加载模型，与音频下载同时进行；下载失败时进程可直接退出，无需等待加载完成
+    service_future: Future = Future()
+
+    def load_service():
+        try:
+            service_future.set_result(get_service(args.model))
+        except BaseException as e:
+            service_future.set_exception(e)
+
+    threading.Thread(target=load_service, daemon=True).start()
+
     # 如果是 URL，下载音频
     if is_url:
         temp_audio_path = "temp_audio.wav"
-        if download_audio(audio_path, temp_audio_path):
-            if audio_to_srt(
-                temp_audio_path,
-                output_srt_path,
-                language=args.language,
-            ):
-                os.remove(temp_audio_path)
-                print(f"临时音频文件 {temp_audio_path} 已删除")
-            else:
-                print(f"转录失败，保留临时音频文件 {temp_audio_path}")
-        else:
+        if not download_audio(audio_path, temp_audio_path):
             print("音频下载失败，退出")
             return
-    else:
-        # 检查本地音频文件是否存在
-        if not os.path.exists(audio_path):
-            print(f"错误：音频文件 {audio_path} 不存在")
-            return
-        audio_to_srt(audio_path, output_srt_path, language=args.language)
+        audio_path = temp_audio_path
+
+    # 初始化转录服务
+    try:
+        service = service_future.result()
+        print(f"转录服务已初始化，使用 {args.model} 模型")
+    except Exception as e:
+        print(f"转录服务初始化失败: {e}")
+        return
+
+    success = asyncio.run(
+        service.transcribe_to_srt(audio_path, output_srt_path, args.language)
+    )
+    if is_url:
+        if success:
+            os.remove(temp_audio_path)
+            print(f"临时音频文件 {temp_audio_path} 已删除")
+        else:
+            print(f"转录失败，保留临时音频文件 {temp_audio_path}")
 
 
 if __name__ == "__main__":
@@ -1,8 +1,26 @@
-from pydantic import BaseModel
+from dataclasses import dataclass, field
+from pydantic import BaseModel, ConfigDict
 from typing import Optional, List, Dict, Any
 
 
+@dataclass
+class TaskState:
+    """内存中的任务状态，字段更新都在事件循环中完成，无需加锁"""
+
+    status: str
+    basename: str  # 不含扩展名的上传文件名，用于生成下载文件名
+    is_srt: bool
+    progress: float = 0.0
+    partial_result: List[Dict[str, Any]] = field(default_factory=list)
+    language: Optional[str] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    finished_at: Optional[float] = None
+
+
 class TaskResponse(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
     status: str
     task_id: Optional[str] = None
     subtitles: Optional[List[Dict[str, Any]]] = None
@@ -13,6 +31,8 @@ class TaskResponse(BaseModel):
 
 
 class SyncTranscriptionResponse(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
     success: bool
     subtitles: List[Dict[str, Any]] = []
     language: Optional[str] = None
@@ -2,12 +2,14 @@
 transcription_service - 音频转录服务包
 """
 
-from .core import TranscriptionService
+from .core import TranscriptionService, get_service, peek_service
 from .schemas import TranscriptionResult
 from .exceptions import TranscriptionError, ModelLoadError, AudioProcessingError
 
 __all__ = [
     "TranscriptionService",
+    "get_service",
+    "peek_service",
     "TranscriptionResult",
     "TranscriptionError",
     "ModelLoadError",
@@ -0,0 +1,291 @@
+import numpy as np
+import asyncio
+from concurrent.futures import Executor
+from typing import TYPE_CHECKING, Optional, List, Dict, Any, Tuple
+import logging
+import os
+
+if TYPE_CHECKING:
+    from faster_whisper.tokenizer import Tokenizer
+    from faster_whisper.vad import SpeechTimestampsMap
+
+logger = logging.getLogger(__name__)
+
+# 单次合批的最大音频条数，小于等于 1 时关闭合批
+MAX_BATCH = int(os.getenv("MAX_BATCH", 8))
+# 收到第一条音频后等待更多请求加入同一批的时间（毫秒）
+BATCH_WAIT_MS = int(os.getenv("BATCH_WAIT_MS", 20))
+# 只有不超过 Whisper 单个窗口（30 秒）的音频才参与合批
+BATCH_MAX_DURATION = 30.0
+# 短音频的束搜索宽度，默认贪心解码以降低延迟；设为5与 faster-whisper 默认一致
+SHORT_AUDIO_BEAM_SIZE = int(os.getenv("SHORT_AUDIO_BEAM_SIZE", 1))
+
+# 与 faster-whisper 默认参数保持一致
+NO_SPEECH_THRESHOLD = 0.6
+LOG_PROB_THRESHOLD = -1.0
+COMPRESSION_RATIO_THRESHOLD = 2.4
+TIME_PRECISION = 0.02
+SAMPLING_RATE = 16000
+
+
+class ShortClipBatcher:
+    """将并发到达的短音频合并为一个批次，只做一次编码器前向和一次批量解码"""
+
+    def __init__(
+        self,
+        model,
+        executor: Executor,
+        max_batch: int = MAX_BATCH,
+        wait_ms: int = BATCH_WAIT_MS,
+        vad_parameters: Optional[Dict[str, Any]] = None,
+    ):
+        """
+        初始化合批器
+
+        Args:
+            model: 已加载的 faster-whisper WhisperModel
+            executor: 执行批量推理的线程池
+            max_batch: 单批最大音频条数
+            wait_ms: 凑批等待时间（毫秒）
+            vad_parameters: 合批前去除静音使用的 VAD 参数，None 表示使用默认值
+        """
+        self.model = model
+        self.executor = executor
+        self.vad_parameters = vad_parameters
+        self.max_batch = max_batch
+        self.wait = wait_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._consumer: Optional[asyncio.Task] = None
+
+    async def submit(
+        self, audio: np.ndarray, language: Optional[str] = None
+    ) -> Tuple[List[Dict[str, Any]], str]:
+        """
+        提交一段不超过 30 秒的 PCM 音频，等待所在批次完成
+
+        Args:
+            audio: 16kHz 单声道 PCM 数组
+            language: 音频语言，None表示自动检测
+
+        Returns:
+            (字幕列表, 语言)
+        """
+        # 指定了语言时先构造分词器，非法语言只让当前请求失败而不影响整批
+        tokenizer = self._make_tokenizer(language) if language else None
+
+        # 与 vad_filter=True 一致：只把语音部分送入模型，之后再还原时间戳
+        speech, timestamps = await asyncio.to_thread(
+            _remove_silence, audio, self.vad_parameters
+        )
+        # 没有语音时与 vad_filter=True 一样直接返回空结果，补零的空白窗口容易产生幻觉文本
+        if speech.shape[0] == 0:
+            return [], language or "en"
+
+        if self._consumer is None or self._consumer.done():
+            self._queue = asyncio.Queue()
+            self._consumer = asyncio.create_task(self._consume())
+
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((speech, tokenizer, future))
+        subtitles, detected_language = await future
+        return _restore_timestamps(subtitles, timestamps), detected_language
+
+    async def _consume(self):
+        """单个消费者协程：凑满一批或等待超时后提交到线程池执行"""
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await self._queue.get()]
+            if self._queue.qsize() < self.max_batch - 1:
+                await asyncio.sleep(self.wait)
+            while len(items) < self.max_batch and not self._queue.empty():
+                items.append(self._queue.get_nowait())
+
+            # 调用方已放弃等待的条目不再参与推理
+            items = [item for item in items if not item[2].done()]
+            if not items:
+                continue
+
+            logger.info(f"Running batched transcription for {len(items)} clips")
+            try:
+                results = await loop.run_in_executor(
+                    self.executor,
+                    self._run_batch,
+                    [(audio, tokenizer) for audio, tokenizer, _ in items],
+                )
+            except Exception as e:
+                logger.error(f"批量转录失败: {e}")
+                for _, _, future in items:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                for (_, _, future), result in zip(items, results):
+                    if not future.done():
+                        future.set_result(result)
+
+    def _make_tokenizer(self, language: str) -> "Tokenizer":
+        from faster_whisper.tokenizer import Tokenizer
+
+        return Tokenizer(
+            self.model.hf_tokenizer,
+            self.model.model.is_multilingual,
+            task="transcribe",
+            language=language,
+        )
+
+    def _run_batch(
+        self, items: List[Tuple[np.ndarray, Optional["Tokenizer"]]]
+    ) -> List[Tuple[List[Dict[str, Any]], str]]:
+        """在线程池中执行：补齐到 30 秒窗口后批量编码、检测语言并解码"""
+        from faster_whisper.audio import pad_or_trim
+        from faster_whisper.transcribe import get_suppressed_tokens
+
+        feature_extractor = self.model.feature_extractor
+        features = np.stack(
+            [
+                pad_or_trim(feature_extractor(audio), feature_extractor.nb_max_frames)
+                for audio, _ in items
+            ]
+        )
+        encoder_output = self.model.encode(features)
+
+        tokenizers = [tokenizer for _, tokenizer in items]
+        if any(tokenizer is None for tokenizer in tokenizers):
+            if self.model.model.is_multilingual:
+                detected = self.model.model.detect_language(encoder_output)
+            else:
+                detected = [[("<|en|>", 1.0)]] * len(items)
+            tokenizers = [
+                tokenizer or self._make_tokenizer(langs[0][0][2:-2])
+                for tokenizer, langs in zip(tokenizers, detected)
+            ]
+
+        results = self.model.model.generate(
+            encoder_output,
+            [self.model.get_prompt(tokenizer, []) for tokenizer in tokenizers],
+            beam_size=SHORT_AUDIO_BEAM_SIZE,
+            max_length=self.model.max_length,
+            suppress_blank=True,
+            suppress_tokens=list(get_suppressed_tokens(tokenizers[0], [-1])),
+            return_scores=True,
+            return_no_speech_prob=True,
+        )
+
+        outputs = []
+        for (audio, _), tokenizer, result in zip(items, tokenizers, results):
+            tokens = result.sequences_ids[0]
+            avg_logprob = result.scores[0] * len(tokens) / (len(tokens) + 1)
+            if (
+                result.no_speech_prob > NO_SPEECH_THRESHOLD
+                and avg_logprob < LOG_PROB_THRESHOLD
+            ):
+                subtitles = []
+            elif _needs_fallback(tokenizer, tokens, avg_logprob):
+                subtitles = self._transcribe_single(audio, tokenizer.language_code)
+            else:
+                duration = audio.shape[0] / feature_extractor.sampling_rate
+                subtitles = _split_segments(tokenizer, tokens, duration)
+            outputs.append((subtitles, tokenizer.language_code))
+        return outputs
+
+    def _transcribe_single(
+        self, audio: np.ndarray, language: str
+    ) -> List[Dict[str, Any]]:
+        """单独转录一条音频，使用 faster-whisper 的温度回退重新解码"""
+        segments, _ = self.model.transcribe(
+            audio,
+            language=language,
+            beam_size=SHORT_AUDIO_BEAM_SIZE,
+            best_of=1,
+            condition_on_previous_text=False,
+            vad_filter=False,
+        )
+        return [
+            {
+                "index": index,
+                "start": segment.start,
+                "end": segment.end,
+                "content": segment.text.strip(),
+            }
+            for index, segment in enumerate(segments, 1)
+        ]
+
+
+def _needs_fallback(
+    tokenizer: "Tokenizer", tokens: List[int], avg_logprob: float
+) -> bool:
+    """贪心解码结果重复或置信度过低时，与 faster-whisper 一样需要提高温度重新解码"""
+    from faster_whisper.transcribe import get_compression_ratio
+
+    text = tokenizer.decode([token for token in tokens if token < tokenizer.eot])
+    return (
+        get_compression_ratio(text) > COMPRESSION_RATIO_THRESHOLD
+        or avg_logprob < LOG_PROB_THRESHOLD
+    )
+
+
+def _remove_silence(
+    audio: np.ndarray, vad_parameters: Optional[Dict[str, Any]]
+) -> Tuple[np.ndarray, Optional["SpeechTimestampsMap"]]:
+    """用 VAD 去掉静音并拼接语音片段，返回拼接后的音频和时间戳映射"""
+    from faster_whisper.vad import (
+        SpeechTimestampsMap,
+        VadOptions,
+        get_speech_timestamps,
+    )
+
+    speech_chunks = get_speech_timestamps(audio, VadOptions(**(vad_parameters or {})))
+    if not speech_chunks:
+        return audio[:0], None
+    speech = np.concatenate(
+        [audio[chunk["start"] : chunk["end"]] for chunk in speech_chunks]
+    )
+    return speech, SpeechTimestampsMap(speech_chunks, SAMPLING_RATE)
+
+
+def _restore_timestamps(
+    subtitles: List[Dict[str, Any]], timestamps: Optional["SpeechTimestampsMap"]
+) -> List[Dict[str, Any]]:
+    """将基于拼接后语音的时间戳还原到原始音频时间轴"""
+    if timestamps is None:
+        return subtitles
+    for subtitle in subtitles:
+        subtitle["start"] = timestamps.get_original_time(subtitle["start"])
+        subtitle["end"] = timestamps.get_original_time(subtitle["end"], is_end=True)
+    return subtitles
+
+
+def _split_segments(
+    tokenizer: "Tokenizer", tokens: List[int], duration: float
+) -> List[Dict[str, Any]]:
+    """按时间戳 token 将解码结果切分为字幕片段"""
+    subtitles = []
+    start = 0.0
+    text_tokens: List[int] = []
+
+    def flush(end: float):
+        text = tokenizer.decode(text_tokens).strip()
+        if text:
+            subtitles.append(
+                {
+                    "index": len(subtitles) + 1,
+                    "start": round(start, 3),
+                    "end": round(min(max(end, start), duration), 3),
+                    "content": text,
+                }
+            )
+
+    for token in tokens:
+        if token >= tokenizer.timestamp_begin:
+            time = (token - tokenizer.timestamp_begin) * TIME_PRECISION
+            if text_tokens:
+                flush(time)
+                start, text_tokens = time, []
+            else:
+                start = time
+        elif token < tokenizer.eot:
+            text_tokens.append(token)
+
+    # 最后一段没有结束时间戳时以音频结尾作为结束时间
+    if text_tokens:
+        flush(duration)
+    return subtitles
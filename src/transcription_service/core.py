@@ -1,68 +1,249 @@
-from faster_whisper import WhisperModel
-import torch
+import numpy as np
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
 from typing import Optional, List, Dict, Any, Callable
 import logging
+import os
+import threading
+import time
 
 from .schemas import TranscriptionResult
-from .utils import get_audio_duration, create_srt_subtitles
+from .utils import SrtWriter
+from .batching import (
+    ShortClipBatcher,
+    MAX_BATCH,
+    BATCH_MAX_DURATION,
+    SHORT_AUDIO_BEAM_SIZE,
+)
 from .exceptions import ModelLoadError, AudioProcessingError
 
 logger = logging.getLogger(__name__)
 
+# 同一进程内最多同时驻留的模型数量
+MAX_CACHED_MODELS = int(os.getenv("MAX_CACHED_MODELS", 2))
+# 每个模型专用的推理线程数量
+INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", 1))
+# 两次进度回调之间的最小间隔（秒），期间产生的片段合并到下一次回调
+PROGRESS_INTERVAL = float(os.getenv("PROGRESS_INTERVAL", 0.25))
+# CTranslate2 单次推理使用的线程数，默认取一半 CPU 核心，避免与其他线程池争抢
+CPU_THREADS = int(os.getenv("CPU_THREADS", max(1, (os.cpu_count() or 2) // 2)))
+# 长音频批量推理时单批的窗口数，设为1关闭批量推理；默认 GPU 为8，CPU 为4
+INFERENCE_BATCH_SIZE = os.getenv("INFERENCE_BATCH_SIZE")
+# VAD 判定语音结束所需的静音时长（毫秒），更短的值会从送入编码器的音频中剔除更多停顿；
+# 未设置时逐段推理使用 DEFAULT_VAD_MIN_SILENCE_MS，批量推理沿用 faster-whisper 的默认值
+VAD_MIN_SILENCE_MS = os.getenv("VAD_MIN_SILENCE_MS")
+DEFAULT_VAD_MIN_SILENCE_MS = 500
+
+# 解码默认参数的版本号，修改会影响转录结果的默认值时需要递增
+DECODE_SETTINGS_VERSION = 3
+# 按优先级排列的计算类型：权重 int8 量化，激活值保持半精度或单精度
+_PREFERRED_COMPUTE_TYPES = {
+    "cuda": ("int8_float16", "float16"),
+    "cpu": ("int8", "int8_float32", "float32"),
+}
+
+
+def _default_compute_type(device: str) -> str:
+    """选择设备支持的最优计算类型，可通过 COMPUTE_TYPE 环境变量覆盖"""
+    compute_type = os.getenv("COMPUTE_TYPE")
+    if compute_type:
+        return compute_type
+    import ctranslate2
+
+    supported = ctranslate2.get_supported_compute_types(device)
+    for compute_type in _PREFERRED_COMPUTE_TYPES[device]:
+        if compute_type in supported:
+            return compute_type
+    return "default"
+
+
+def _detect_device() -> str:
+    """有可用 GPU 时使用 cuda，否则使用 cpu"""
+    import torch
+
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def _default_batch_size(device: str) -> int:
+    """长音频批量推理的窗口数，可通过 INFERENCE_BATCH_SIZE 环境变量覆盖"""
+    return int(INFERENCE_BATCH_SIZE or (8 if device == "cuda" else 4))
+
+
+@lru_cache(maxsize=None)
+def decode_settings_key() -> str:
+    """
+    影响转录结果的设置摘要，作为结果缓存键的一部分，设置变化后旧结果不再命中
+
+    结果缓存可能被同一主机上的多个实例共享，因此按实际使用的设备和计算类型计算，
+    而不是只看环境变量。首次调用会导入 torch 检测设备。
+    """
+    device = _detect_device()
+    settings = (
+        DECODE_SETTINGS_VERSION,
+        device,
+        _default_compute_type(device),
+        _default_batch_size(device),
+        VAD_MIN_SILENCE_MS,
+        SHORT_AUDIO_BEAM_SIZE,
+        MAX_BATCH > 1,
+    )
+    return hashlib.blake2b(repr(settings).encode(), digest_size=4).hexdigest()
+
 
 class TranscriptionService:
     """音频转录服务类"""
 
-    def __init__(self, model_size: str = "large-v3"):
+    def __init__(
+        self,
+        model_size: str = "large-v3",
+        compute_type: Optional[str] = None,
+        batch_size: Optional[int] = None,
+    ):
         """
         初始化转录服务
 
         Args:
             model_size: Whisper模型大小
+            compute_type: CTranslate2 计算类型，None 表示按设备自动选择
+            batch_size: 长音频批量推理的窗口数，None 表示按设备自动选择，1 表示逐窗口推理
+
+        Raises:
+            RuntimeError: 同一进程内已加载了该模型，应通过 get_service 复用
         """
+        if model_size in _model_cache:
+            raise RuntimeError(
+                f"{model_size} 模型已加载，请通过 get_service 获取转录服务实例"
+            )
         self.model_size = model_size
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.device = _detect_device()
+        self.compute_type = compute_type or _default_compute_type(self.device)
+        self.batch_size = batch_size or _default_batch_size(self.device)
         self.model = None
-        self.executor = ThreadPoolExecutor(max_workers=2)  # 用于执行CPU密集型任务
+        self.pipeline = None
+        # 模型推理只在专用线程中执行，不与音频解码等任务争抢线程
+        self.inference_executor = ThreadPoolExecutor(
+            max_workers=INFERENCE_THREADS,
+            thread_name_prefix=f"whisper-{model_size}",
+        )
         self._load_model()
+        # 并发的短音频合并为一批推理
+        self.batcher = (
+            ShortClipBatcher(
+                self.model,
+                self.inference_executor,
+                vad_parameters={
+                    "min_silence_duration_ms": int(
+                        VAD_MIN_SILENCE_MS or DEFAULT_VAD_MIN_SILENCE_MS
+                    )
+                },
+            )
+            if MAX_BATCH > 1
+            else None
+        )
 
     def _load_model(self):
         """加载 faster-whisper 模型"""
+        import ctranslate2
+        from faster_whisper import BatchedInferencePipeline, WhisperModel
+
         try:
-            logger.info(f"使用设备: {self.device} 加载 {self.model_size} 模型")
+            logger.info(
+                f"使用设备: {self.device} ({self.compute_type}) 加载 {self.model_size} 模型"
+            )
+            # 固定随机种子，温度回退采样时同一音频的结果可复现
+            ctranslate2.set_random_seed(0)
+            # num_workers 与推理线程数一致，多个推理线程才能真正并行
             self.model = WhisperModel(
                 self.model_size,
                 device=self.device,
-                compute_type="int8" if self.device == "cpu" else "float16",
+                compute_type=self.compute_type,
+                cpu_threads=CPU_THREADS,
+                num_workers=INFERENCE_THREADS,
             )
+            # 按 VAD 切分后将多个窗口合并送入编码器
+            if self.batch_size > 1:
+                self.pipeline = BatchedInferencePipeline(model=self.model)
             logger.info("faster-whisper 模型加载完成")
         except Exception as e:
             logger.error(f"模型加载失败: {e}")
             raise ModelLoadError(f"Failed to load model: {e}")
 
+    def warmup(self):
+        """用一段静音预热模型，让首个真实请求不再承担 CUDA 内核初始化等一次性开销"""
+        if not self.model:
+            return
+        try:
+            segments, _ = self.model.transcribe(
+                np.zeros(16000, dtype=np.float32),
+                language="en",
+                beam_size=1,
+                vad_filter=False,
+                without_timestamps=True,
+            )
+            list(segments)
+            logger.info("模型预热完成")
+        except Exception as e:
+            logger.warning(f"模型预热失败: {e}")
+
+    def _load_audio(self, audio_path: str) -> tuple:
+        """在进程内解码音频为模型所需采样率的单声道 PCM，返回 (音频数组, 时长秒数)"""
+        from faster_whisper import decode_audio
+
+        sampling_rate = self.model.feature_extractor.sampling_rate
+        audio = decode_audio(audio_path, sampling_rate=sampling_rate)
+        return audio, audio.shape[0] / sampling_rate
+
+    def _segments(self, audio: np.ndarray, language: Optional[str]) -> tuple:
+        """开始转录，返回 (片段迭代器, 音频信息)；启用批量推理时编码器一次处理多个窗口"""
+        # faster-whisper 先用 VAD 拼接语音片段再送入编码器，并把时间戳还原到原始音频
+        options = {"language": language, "vad_filter": True}
+        # 短音频走快速路径：缩小束搜索宽度，且不以前文作为提示，避免重复幻觉
+        duration = audio.shape[0] / self.model.feature_extractor.sampling_rate
+        if duration <= BATCH_MAX_DURATION:
+            options.update(
+                beam_size=SHORT_AUDIO_BEAM_SIZE,
+                best_of=1,
+                condition_on_previous_text=False,
+            )
+        else:
+            options.update(beam_size=5)
+        if self.pipeline:
+            # 批量推理自带按窗口切分的 VAD 默认值（160ms 静音、30s 片段），只在显式配置时覆盖
+            if VAD_MIN_SILENCE_MS:
+                options["vad_parameters"] = {
+                    "min_silence_duration_ms": int(VAD_MIN_SILENCE_MS)
+                }
+            # 批量推理默认不预测时间戳，只能给出整段 VAD 片段的粗略时间，需显式开启
+            return self.pipeline.transcribe(
+                audio, batch_size=self.batch_size, without_timestamps=False, **options
+            )
+        options["vad_parameters"] = {
+            "min_silence_duration_ms": int(
+                VAD_MIN_SILENCE_MS or DEFAULT_VAD_MIN_SILENCE_MS
+            )
+        }
+        return self.model.transcribe(audio, **options)
+
     def _transcribe_sync(
-        self, audio_path: str, language: Optional[str] = None
+        self,
+        audio: np.ndarray,
+        language: Optional[str] = None,
+        segment_callback: Optional[Callable[[Dict[str, Any]], None]] = None,
     ) -> tuple:
         """同步转录方法，在线程池中执行"""
         try:
             if not self.model:
                 return False, [], "unknown", "模型未加载"
 
-            # 获取音频总时长
-            total_duration = get_audio_duration(audio_path)
-            logger.info(f"Audio duration: {total_duration} seconds")
-
             # 转录音频
             subtitles = []
-            segments, info = self.model.transcribe(
-                audio_path, language=language, vad_filter=True, beam_size=5
-            )
+            started = time.monotonic()
+            segments, info = self._segments(audio, language)
 
-            segment_index = 0
-            for segment in segments:
-                segment_index += 1
+            for segment_index, segment in enumerate(segments, 1):
                 subtitle_data = {
                     "index": segment_index,
                     "start": segment.start,
@@ -70,8 +251,13 @@ class TranscriptionService:
                     "content": segment.text.strip(),
                 }
                 subtitles.append(subtitle_data)
-                logger.info(f"Segment {segment_index}: {subtitle_data['content']}")
+                if segment_callback:
+                    segment_callback(subtitle_data)
+                logger.debug("Segment %d: %s", segment_index, subtitle_data["content"])
 
+            logger.info(
+                "转录 %d 个片段，耗时 %.2fs", len(subtitles), time.monotonic() - started
+            )
             detected_language = info.language if info else "unknown"
             logger.info(f"音频转录完成，检测到的主要语言: {detected_language}")
 
@@ -88,6 +274,7 @@ class TranscriptionService:
         progress_callback: Optional[
             Callable[[float, List[Dict[str, Any]], str], None]
         ] = None,
+        segment_callback: Optional[Callable[[Dict[str, Any]], None]] = None,
     ) -> TranscriptionResult:
         """
         转录音频文件（异步版本）
@@ -96,6 +283,7 @@ class TranscriptionService:
             audio_path: 音频文件路径
             language: 音频语言，None表示自动检测
             progress_callback: 回调函数，用于实时更新进度和中间字幕
+            segment_callback: 在推理线程中对每条新字幕调用的同步函数，短音频合批时不调用
 
         Returns:
             TranscriptionResult: 转录结果
@@ -104,13 +292,38 @@ class TranscriptionService:
             # 如果有进度回调，需要实现渐进式更新
             if progress_callback:
                 return await self._transcribe_with_progress(
-                    audio_path, language, progress_callback
+                    audio_path, language, progress_callback, segment_callback
+                )
+
+            if not self.model:
+                return TranscriptionResult(
+                    success=False, subtitles=[], language="", error="模型未加载"
+                )
+
+            # 只解码一次音频，时长判断和转录共用同一份 PCM 数据
+            loop = asyncio.get_running_loop()
+            audio, total_duration = await asyncio.to_thread(
+                self._load_audio, audio_path
+            )
+            logger.info(f"Audio duration: {total_duration} seconds")
+
+            # 30 秒以内的短音频交给合批器，与其他并发请求共用一次前向推理
+            if self.batcher and total_duration <= BATCH_MAX_DURATION:
+                subtitles, detected_language = await self.batcher.submit(
+                    audio, language
+                )
+                logger.info(f"音频转录完成，检测到的主要语言: {detected_language}")
+                return TranscriptionResult(
+                    success=True, subtitles=subtitles, language=detected_language
                 )
 
-            # 简单情况下直接在线程池中执行
-            loop = asyncio.get_event_loop()
+            # 较长音频直接在线程池中逐条转录
             success, subtitles, detected_language, error = await loop.run_in_executor(
-                self.executor, self._transcribe_sync, audio_path, language
+                self.inference_executor,
+                self._transcribe_sync,
+                audio,
+                language,
+                segment_callback,
             )
 
             return TranscriptionResult(
@@ -131,6 +344,7 @@ class TranscriptionService:
         audio_path: str,
         language: Optional[str],
         progress_callback: Callable[[float, List[Dict[str, Any]], str], None],
+        segment_callback: Optional[Callable[[Dict[str, Any]], None]] = None,
     ) -> TranscriptionResult:
         """带进度回调的转录方法"""
         try:
@@ -139,24 +353,22 @@ class TranscriptionService:
                     success=False, subtitles=[], language="", error="模型未加载"
                 )
 
-            # 获取音频总时长
-            loop = asyncio.get_event_loop()
+            loop = asyncio.get_running_loop()
 
-            total_duration = await loop.run_in_executor(
-                self.executor, get_audio_duration, audio_path
+            # 只解码一次音频，时长计算和转录共用同一份 PCM 数据
+            audio, total_duration = await asyncio.to_thread(
+                self._load_audio, audio_path
             )
             logger.info(f"Audio duration: {total_duration} seconds")
 
-            # 在线程池中执行转录，但需要定期检查进度
+            # 在推理线程中执行转录，但需要定期检查进度
             def transcribe_with_callback():
                 subtitles = []
-                segments, info = self.model.transcribe(
-                    audio_path, language=language, vad_filter=True, beam_size=5
-                )
+                last_report = 0.0
+                started = time.monotonic()
+                segments, info = self._segments(audio, language)
 
-                segment_index = 0
-                for segment in segments:
-                    segment_index += 1
+                for segment_index, segment in enumerate(segments, 1):
                     subtitle_data = {
                         "index": segment_index,
                         "start": segment.start,
@@ -164,23 +376,38 @@ class TranscriptionService:
                         "content": segment.text.strip(),
                     }
                     subtitles.append(subtitle_data)
+                    if segment_callback:
+                        segment_callback(subtitle_data)
 
                     # 计算进度并调用回调（需要在主线程中执行）
                     progress = min(segment.end / total_duration * 100, 100.0)
 
-                    # 将回调调度到主事件循环
-                    asyncio.run_coroutine_threadsafe(
-                        progress_callback(progress, subtitles, info.language), loop
-                    )
-
-                    logger.info(
-                        f"Segment {segment_index}: {subtitle_data['content']}, progress: {progress:.2f}%"
+                    # 按固定间隔将回调调度到主事件循环，避免每个片段都切换一次线程；
+                    # 不需要回调结果，直接在事件循环中创建任务，省去跨线程 Future
+                    now = time.monotonic()
+                    if now - last_report >= PROGRESS_INTERVAL:
+                        last_report = now
+                        loop.call_soon_threadsafe(
+                            loop.create_task,
+                            progress_callback(progress, subtitles, info.language),
+                        )
+
+                    logger.debug(
+                        "Segment %d: %s, progress: %.2f%%",
+                        segment_index,
+                        subtitle_data["content"],
+                        progress,
                     )
 
+                logger.info(
+                    "转录 %d 个片段，耗时 %.2fs",
+                    len(subtitles),
+                    time.monotonic() - started,
+                )
                 return subtitles, info.language
 
             subtitles, detected_language = await loop.run_in_executor(
-                self.executor, transcribe_with_callback
+                self.inference_executor, transcribe_with_callback
             )
 
             logger.info(f"音频转录完成，检测到的主要语言: {detected_language}")
@@ -216,31 +443,113 @@ class TranscriptionService:
         Returns:
             bool: 是否成功
         """
+        # 先写入同目录下的临时文件，完成后原子替换，读取方不会看到写了一半的字幕
+        part_path = f"{output_srt_path}.part"
         try:
-            result = await self.transcribe(audio_path, language, progress_callback)
-            if not result.success:
-                return False
-
-            # 在线程池中生成SRT文件
-            def generate_srt():
-                # 生成SRT字幕
-                srt_content = create_srt_subtitles(result.subtitles)
+            # 字幕在推理线程中边识别边写入文件，不必等全部转录完成再整体生成；
+            # 逐条写入的字幕先进入 1MiB 缓冲区，减少系统调用次数
+            with open(part_path, "w", encoding="utf-8", buffering=1 << 20) as f:
+                writer = SrtWriter(f)
+                result = await self.transcribe(
+                    audio_path, language, progress_callback, writer.write
+                )
+                if not result.success:
+                    return False
 
-                # 保存为SRT文件
-                with open(output_srt_path, "w", encoding="utf-8") as f:
-                    f.write(srt_content)
+                def finish():
+                    # 合批转录的短音频不会逐条回调，在这里补写剩余字幕
+                    writer.write_all(result.subtitles)
+                    f.flush()
+                    os.fsync(f.fileno())
 
-            loop = asyncio.get_event_loop()
-            await loop.run_in_executor(self.executor, generate_srt)
+                await asyncio.to_thread(finish)
 
+            os.replace(part_path, output_srt_path)
             logger.info(f"SRT 字幕已保存到 {output_srt_path}")
             return True
 
         except Exception as e:
             logger.error(f"生成SRT文件失败: {e}")
             return False
-
-    def __del__(self):
-        """清理资源"""
-        if hasattr(self, "executor"):
-            self.executor.shutdown(wait=False)
+        finally:
+            if os.path.exists(part_path):
+                os.unlink(part_path)
+
+
+_model_cache: "OrderedDict[str, TranscriptionService]" = OrderedDict()
+# 正在加载的模型，同一模型的并发请求等待同一次加载
+_loading: Dict[str, Future] = {}
+_model_cache_lock = threading.Lock()
+
+
+def peek_service(model_size: str) -> Optional[TranscriptionService]:
+    """
+    非阻塞地获取已加载的转录服务实例
+
+    模型未加载或缓存正被其他线程短暂占用时返回 None，
+    调用方应退回到在线程池中调用 get_service。
+    """
+    if not _model_cache_lock.acquire(blocking=False):
+        return None
+    try:
+        service = _model_cache.get(model_size)
+        if service is not None:
+            _model_cache.move_to_end(model_size)
+        return service
+    finally:
+        _model_cache_lock.release()
+
+
+def get_service(model_size: str) -> TranscriptionService:
+    """
+    按模型大小获取转录服务实例
+
+    已加载的模型会被复用；缓存超过 MAX_CACHED_MODELS 时淘汰最久未使用的模型。
+    模型在锁外加载，加载期间其他已加载模型的请求不受影响。
+    首次加载会阻塞调用线程，异步代码中应放到线程池里调用。
+
+    Args:
+        model_size: Whisper模型大小
+
+    Returns:
+        TranscriptionService: 转录服务实例
+    """
+    with _model_cache_lock:
+        service = _model_cache.get(model_size)
+        if service is not None:
+            _model_cache.move_to_end(model_size)
+            return service
+        loading = _loading.get(model_size)
+        is_loader = loading is None
+        if is_loader:
+            loading = _loading[model_size] = Future()
+
+    # 已有线程在加载同一模型时等待其结果
+    if not is_loader:
+        return loading.result()
+
+    try:
+        service = TranscriptionService(model_size=model_size)
+    except BaseException as e:
+        with _model_cache_lock:
+            _loading.pop(model_size, None)
+        loading.set_exception(e)
+        raise
+
+    with _model_cache_lock:
+        _loading.pop(model_size, None)
+        _model_cache[model_size] = service
+
+        while len(_model_cache) > MAX_CACHED_MODELS:
+            evicted_size, evicted = _model_cache.popitem(last=False)
+            logger.info(f"模型缓存已满，卸载 {evicted_size} 模型")
+            # 不主动关闭推理线程池：仍在使用该模型的请求会继续提交推理，
+            # 最后一个引用释放后空闲线程会自行退出
+            del evicted
+            if service.device == "cuda":
+                import torch
+
+                torch.cuda.empty_cache()
+
+    loading.set_result(service)
+    return service
@@ -1,23 +1,97 @@
-import soundfile as sf
-from datetime import timedelta
-import srt
+import re
+from typing import Any, Dict, List, TextIO
 
+import numpy as np
 
-def get_audio_duration(audio_path: str) -> float:
-    """获取音频文件的时长（秒）"""
-    with sf.SoundFile(audio_path) as f:
-        return f.frames / f.samplerate
+# SRT 字幕内容中不允许出现空行
+_BLANK_LINES = re.compile(r"\n\n+")
+
+
+def _to_microseconds(seconds) -> np.ndarray:
+    """将秒数批量转换为整数微秒，精度与 timedelta 一致"""
+    return np.round(np.fromiter(seconds, dtype=np.float64) * 1e6).astype(np.int64)
+
+
+def _format_timestamps(micros: np.ndarray) -> List[str]:
+    """将微秒数组批量格式化为 SRT 时间戳（HH:MM:SS,mmm）"""
+    hours, rem = np.divmod(micros // 1000, 3_600_000)
+    minutes, rem = np.divmod(rem, 60_000)
+    secs, millis = np.divmod(rem, 1000)
+    return [
+        f"{h:02d}:{m:02d}:{s:02d},{ms:03d}"
+        for h, m, s, ms in zip(
+            hours.tolist(), minutes.tolist(), secs.tolist(), millis.tolist()
+        )
+    ]
+
+
+def _format_timestamp(micros: int) -> str:
+    """将单个微秒数格式化为 SRT 时间戳，逐条写入时避免创建 numpy 数组"""
+    hours, rem = divmod(micros // 1000, 3_600_000)
+    minutes, rem = divmod(rem, 60_000)
+    secs, millis = divmod(rem, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d},{millis:03d}"
+
+
+def _legal_content(content: str) -> str:
+    """去掉会破坏 SRT 结构的空行"""
+    if content and content[0] != "\n" and "\n\n" not in content:
+        return content
+    return _BLANK_LINES.sub("\n", content.strip("\n"))
 
 
 def create_srt_subtitles(subtitle_data: list) -> str:
     """根据字幕数据创建SRT格式字幕"""
-    subtitles = [
-        srt.Subtitle(
-            index=item["index"],
-            start=timedelta(seconds=item["start"]),
-            end=timedelta(seconds=item["end"]),
-            content=item["content"],
+    count = len(subtitle_data)
+    starts = _to_microseconds(item["start"] for item in subtitle_data)
+    ends = _to_microseconds(item["end"] for item in subtitle_data)
+    indexes = np.fromiter(
+        (item["index"] for item in subtitle_data), dtype=np.int64, count=count
+    )
+    has_content = np.fromiter(
+        (bool(item["content"].strip()) for item in subtitle_data),
+        dtype=bool,
+        count=count,
+    )
+
+    # 与 srt.compose 保持一致：跳过空字幕和无效时间段，按时间排序并重新编号
+    valid = np.flatnonzero(has_content & (starts >= 0) & (starts < ends))
+    order = valid[np.lexsort((indexes[valid], ends[valid], starts[valid]))]
+
+    start_stamps = _format_timestamps(starts[order])
+    end_stamps = _format_timestamps(ends[order])
+    return "".join(
+        f"{n}\n{start} --> {end}\n{_legal_content(subtitle_data[i]['content'])}\n\n"
+        for n, (i, start, end) in enumerate(
+            zip(order.tolist(), start_stamps, end_stamps), 1
         )
-        for item in subtitle_data
-    ]
-    return srt.compose(subtitles)
+    )
+
+
+class SrtWriter:
+    """将字幕逐条追加写入 SRT 文件，规则与 create_srt_subtitles 一致，但不重新排序"""
+
+    def __init__(self, file: TextIO):
+        self._file = file
+        self._written = 0  # 已写入的字幕条数，用于编号
+        self._consumed = 0  # 已处理的字幕数据条数
+
+    def write(self, subtitle: Dict[str, Any]) -> None:
+        """写入一条字幕，跳过空字幕和无效时间段"""
+        self._consumed += 1
+        content = subtitle["content"]
+        # 与 _to_microseconds 相同的舍入方式，保证与 create_srt_subtitles 输出一致
+        start = round(subtitle["start"] * 1e6)
+        end = round(subtitle["end"] * 1e6)
+        if not content.strip() or start < 0 or start >= end:
+            return
+        self._written += 1
+        self._file.write(
+            f"{self._written}\n{_format_timestamp(start)} --> "
+            f"{_format_timestamp(end)}\n{_legal_content(content)}\n\n"
+        )
+
+    def write_all(self, subtitle_data: List[Dict[str, Any]]) -> None:
+        """补写 subtitle_data 中尚未写入的字幕"""
+        for subtitle in subtitle_data[self._consumed :]:
+            self.write(subtitle)
@@ -1,6 +1,44 @@
-from ..config.app_config import ALLOWED_EXTENSIONS
+import asyncio
+import hashlib
+import os
+
+from fastapi import HTTPException, UploadFile
+
+from ..config.app_config import ALLOWED_EXTENSIONS, MAX_CONTENT_LENGTH
+
+# 上传文件落盘时的分块大小
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+# 带点号的小写扩展名集合，只在导入时计算一次
+_ALLOWED_SUFFIXES = frozenset(
+    "." + ext.lower().lstrip(".") for ext in ALLOWED_EXTENSIONS
+)
+# 文件名中不允许出现的字符：空字符和路径分隔符
+_FORBIDDEN_CHARS = ("\0", "/", "\\")
 
 
 def allowed_file(filename: str) -> bool:
-    """检查文件扩展名是否允许"""
-    return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
+    """检查文件扩展名是否允许，同时拒绝包含空字符或路径分隔符的文件名"""
+    if any(char in filename for char in _FORBIDDEN_CHARS):
+        return False
+    return os.path.splitext(filename)[1].lower() in _ALLOWED_SUFFIXES
+
+
+async def save_upload_file(
+    file: UploadFile, path: str, max_size: int = MAX_CONTENT_LENGTH
+) -> str:
+    """将上传文件分块写入指定路径，避免整个文件驻留内存，返回文件内容哈希；超过 max_size 时返回 413"""
+
+    def copy() -> str:
+        digest = hashlib.blake2b(digest_size=16)
+        written = 0
+        with open(path, "wb") as out:
+            while chunk := file.file.read(UPLOAD_CHUNK_SIZE):
+                written += len(chunk)
+                if written > max_size:
+                    raise HTTPException(status_code=413, detail="文件过大")
+                digest.update(chunk)
+                out.write(chunk)
+        return digest.hexdigest()
+
+    return await asyncio.get_running_loop().run_in_executor(None, copy)
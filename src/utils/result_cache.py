@@ -0,0 +1,74 @@
+import json
+import sqlite3
+import threading
+import time
+from typing import Optional, List, Dict, Any, Tuple
+
+from ..transcription_service.core import decode_settings_key
+
+
+def make_cache_key(audio_hash: str, language: Optional[str], model_size: str) -> str:
+    """根据音频内容哈希、语言、模型大小和解码设置生成缓存键"""
+    return f"{audio_hash}:{language or 'auto'}:{model_size}:{decode_settings_key()}"
+
+
+class ResultCache:
+    """基于 SQLite 的转录结果缓存，相同音频重复提交时直接返回已有结果"""
+
+    def __init__(self, path: str, max_entries: int):
+        """
+        初始化结果缓存
+
+        Args:
+            path: SQLite 数据库文件路径
+            max_entries: 最多保留的结果条数，超出时淘汰最久未使用的条目
+        """
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, "
+                "subtitles_json TEXT NOT NULL, "
+                "language TEXT, "
+                "accessed REAL NOT NULL)"
+            )
+            self._conn.commit()
+
+    def get(self, key: str) -> Optional[Tuple[List[Dict[str, Any]], str]]:
+        """查询缓存，命中时返回 (字幕列表, 语言) 并刷新访问时间"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT subtitles_json, language FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key)
+            )
+            self._conn.commit()
+        return json.loads(row[0]), row[1]
+
+    def put(self, key: str, subtitles: List[Dict[str, Any]], language: str):
+        """写入转录结果，超出容量时淘汰最久未使用的条目"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                (key, json.dumps(subtitles, ensure_ascii=False), language, time.time()),
+            )
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM results WHERE key IN "
+                    "(SELECT key FROM results ORDER BY accessed LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+            self._conn.commit()
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
@@ -1,15 +1,134 @@
-import tempfile
-import os
 import logging
 import asyncio
+import time
 from typing import Optional
 
-from ..config.shared_state import tasks, tasks_lock
+from ..config.shared_state import tasks
 from ..config import shared_state
-from ..transcription_service.core import TranscriptionService
+from ..config.app_config import MAX_TASKS, TASK_TTL
+from ..transcription_service.core import get_service, peek_service
+from ..transcription_service.schemas import TranscriptionResult
+from ..transcription_service.utils import create_srt_subtitles
 
 logger = logging.getLogger(__name__)
 
+# 过期任务清理间隔（秒）
+JANITOR_INTERVAL = 60
+
+
+def _schedule_task(coro) -> asyncio.Task:
+    """创建后台任务并登记到 background_tasks，任务结束后自动移除"""
+    task = asyncio.create_task(coro)
+    shared_state.background_tasks.add(task)
+    task.add_done_callback(shared_state.background_tasks.discard)
+    return task
+
+
+def _evict_oldest_tasks():
+    """任务数达到上限时淘汰最早创建的任务，调用方需在同一步中插入新任务，中间不能 await"""
+    while len(tasks) >= MAX_TASKS:
+        task_id, _ = tasks.popitem(last=False)
+        logger.warning(f"Task store full, evicted task {task_id}")
+
+
+async def _discard_task(task_id: str):
+    """删除已取走结果的任务"""
+    tasks.pop(task_id, None)
+
+
+async def _task_janitor():
+    """定期清理已结束但超过 TASK_TTL 仍未被取走结果的任务"""
+    while True:
+        await asyncio.sleep(JANITOR_INTERVAL)
+        deadline = time.monotonic() - TASK_TTL
+        # 任务存储只在事件循环中访问，遍历和删除之间没有 await，无需加锁
+        expired = [
+            task_id
+            for task_id, task in tasks.items()
+            if task.finished_at is not None and task.finished_at < deadline
+        ]
+        for task_id in expired:
+            tasks.pop(task_id, None)
+        if expired:
+            logger.info(f"Removed {len(expired)} expired tasks")
+
+
+async def _transcribe_cached(
+    audio_path: str,
+    language: Optional[str],
+    model_size: str,
+    cache_key: Optional[str] = None,
+    progress_callback=None,
+) -> TranscriptionResult:
+    """先查询结果缓存，未命中时执行转录并缓存成功结果；相同音频的并发请求只转录一次"""
+    loop = asyncio.get_running_loop()
+    cache = shared_state.result_cache
+    if cache and cache_key:
+        cached = await loop.run_in_executor(None, cache.get, cache_key)
+        if cached:
+            subtitles, detected_language = cached
+            logger.info(f"Result cache hit: {cache_key}")
+            return TranscriptionResult(
+                success=True, subtitles=subtitles, language=detected_language
+            )
+
+    if not cache_key:
+        return await _run_transcription(
+            audio_path, language, model_size, progress_callback
+        )
+
+    # 已有相同音频正在转录时直接等待其结果
+    pending = shared_state.inflight.get(cache_key)
+    if pending is not None:
+        logger.info(f"Joining in-flight transcription: {cache_key}")
+        return await asyncio.shield(pending)
+
+    future = loop.create_future()
+    shared_state.inflight[cache_key] = future
+    try:
+        result = await _run_transcription(
+            audio_path, language, model_size, progress_callback
+        )
+        if result.success and cache:
+            # 缓存写入失败不影响已经成功的转录结果
+            try:
+                await loop.run_in_executor(
+                    None, cache.put, cache_key, result.subtitles, result.language
+                )
+            except Exception as e:
+                logger.warning(f"Failed to cache result {cache_key}: {e}")
+    except BaseException as e:
+        future.set_result(
+            TranscriptionResult(
+                success=False, subtitles=[], language="", error=str(e) or "转录失败"
+            )
+        )
+        raise
+    else:
+        future.set_result(result)
+    finally:
+        shared_state.inflight.pop(cache_key, None)
+    return result
+
+
+async def _run_transcription(
+    audio_path: str,
+    language: Optional[str],
+    model_size: str,
+    progress_callback=None,
+) -> TranscriptionResult:
+    """获取对应模型的服务实例并执行转录"""
+    # 等待启动时的默认模型加载完成，再按需获取对应模型的服务实例
+    await shared_state.service_ready.wait()
+    async with shared_state.task_semaphore:
+        # 模型已加载时直接取用，只有需要加载模型时才交给线程池
+        service = peek_service(model_size)
+        if service is None:
+            service = await asyncio.get_running_loop().run_in_executor(
+                None, get_service, model_size
+            )
+        return await service.transcribe(audio_path, language, progress_callback)
+
 
 async def _transcribe_task(
     task_id: str,
@@ -17,90 +136,65 @@ async def _transcribe_task(
     language: Optional[str],
     model_size: str,
     is_srt: bool = False,
+    cache_key: Optional[str] = None,
 ):
     """异步转录任务 - 确保在后台真正异步执行"""
+    # 任务状态对象只在事件循环中修改，即使任务已被删除也可以安全写入
+    task = tasks.get(task_id)
+    if task is None:
+        logger.warning(f"Task {task_id} was evicted before it started")
+        shared_state.temp_pool.release(temp_audio_path)
+        return
+
     try:
-        async with tasks_lock:
-            tasks[task_id]["status"] = "processing"
-            tasks[task_id]["progress"] = 0.0
-            tasks[task_id]["partial_result"] = []
-            tasks[task_id]["language"] = None
-            logger.info(f"Task {task_id} started processing")
+        logger.info(f"Task {task_id} started processing")
 
         # 定义进度回调函数
         async def progress_callback(
             progress: float, subtitles: list, detected_language: str
         ):
-            async with tasks_lock:
-                if task_id in tasks:  # 防止任务被删除后仍然更新
-                    tasks[task_id]["progress"] = progress
-                    tasks[task_id]["partial_result"] = subtitles.copy()
-                    tasks[task_id]["language"] = detected_language
-                    logger.info(f"Task {task_id} progress: {progress:.2f}%")
-
-        # 关键修复：确保转录操作真正异步执行
-        if is_srt:
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".srt") as tmp_srt:
-                temp_srt_path = tmp_srt.name
-
-            # 使用 asyncio.create_task 确保异步执行
-            success = await shared_state.service.transcribe_to_srt(
-                temp_audio_path, temp_srt_path, language, progress_callback
-            )
+            # 直接引用转录线程中持续追加的字幕列表，只在查询时由响应模型复制
+            task.progress = progress
+            task.partial_result = subtitles
+            task.language = detected_language
+            logger.info(f"Task {task_id} progress: {progress:.2f}%")
 
-            async with tasks_lock:
-                if task_id in tasks:  # 防止任务被删除
-                    if success:
-                        tasks[task_id]["status"] = "completed"
-                        tasks[task_id]["result"] = temp_srt_path
-                        tasks[task_id]["progress"] = 100.0
-                        logger.info(f"Task {task_id} completed successfully")
-                    else:
-                        tasks[task_id]["status"] = "failed"
-                        tasks[task_id]["error"] = "SRT转录失败"
-                        logger.error(f"Task {task_id} failed: SRT转录失败")
-        else:
-            # 使用 asyncio.create_task 确保异步执行
-            result = await shared_state.service.transcribe(
-                temp_audio_path, language, progress_callback
-            )
+        result = await _transcribe_cached(
+            temp_audio_path, language, model_size, cache_key, progress_callback
+        )
 
-            async with tasks_lock:
-                if task_id in tasks:  # 防止任务被删除
-                    if result.success:
-                        tasks[task_id]["status"] = "completed"
-                        tasks[task_id]["result"] = {
-                            "subtitles": result.subtitles,
-                            "language": result.language,
-                        }
-                        tasks[task_id]["progress"] = 100.0
-                        tasks[task_id]["partial_result"] = result.subtitles
-                        tasks[task_id]["language"] = result.language
-                        logger.info(f"Task {task_id} completed successfully")
-                    else:
-                        tasks[task_id]["status"] = "failed"
-                        tasks[task_id]["error"] = result.error
-                        logger.error(f"Task {task_id} failed: {result.error}")
+        if result.success:
+            task.status = "completed"
+            if is_srt:
+                task.result = {"srt_text": create_srt_subtitles(result.subtitles)}
+            else:
+                task.result = {
+                    "subtitles": result.subtitles,
+                    "language": result.language,
+                }
+                task.partial_result = result.subtitles
+                task.language = result.language
+            task.progress = 100.0
+            logger.info(f"Task {task_id} completed successfully")
+        else:
+            task.status = "failed"
+            task.error = result.error
+            logger.error(f"Task {task_id} failed: {result.error}")
 
     except asyncio.CancelledError:
         logger.info(f"Task {task_id} was cancelled")
-        async with tasks_lock:
-            if task_id in tasks:
-                tasks[task_id]["status"] = "failed"
-                tasks[task_id]["error"] = "任务被取消"
+        task.status = "failed"
+        task.error = "任务被取消"
     except Exception as e:
-        async with tasks_lock:
-            if task_id in tasks:
-                tasks[task_id]["status"] = "failed"
-                tasks[task_id]["error"] = str(e)
-                logger.error(f"Task {task_id} failed with exception: {e}")
+        task.status = "failed"
+        task.error = str(e)
+        logger.error(f"Task {task_id} failed with exception: {e}")
     finally:
-        # 清理临时文件
+        task.finished_at = time.monotonic()
+
+        # 归还临时文件
         try:
-            if os.path.exists(temp_audio_path):
-                await asyncio.get_event_loop().run_in_executor(
-                    None, os.unlink, temp_audio_path
-                )
-                logger.info(f"Deleted temporary audio file {temp_audio_path}")
+            shared_state.temp_pool.release(temp_audio_path)
+            logger.info(f"Released temporary audio file {temp_audio_path}")
         except Exception as e:
-            logger.warning(f"无法删除临时音频文件 {temp_audio_path}: {e}")
+            logger.warning(f"无法归还临时音频文件 {temp_audio_path}: {e}")
@@ -0,0 +1,61 @@
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+
+class TempFilePool:
+    """预分配的临时文件池，请求间复用同一批文件，避免每次上传都创建/删除文件"""
+
+    def __init__(self, size: int):
+        """
+        初始化临时文件池
+
+        Args:
+            size: 池中预分配的文件数量
+        """
+        self.directory = tempfile.mkdtemp(prefix="audio_to_srt_pool_")
+        self._slots: asyncio.Queue = asyncio.Queue()
+        self._cleanup_q: asyncio.Queue = asyncio.Queue()
+        self._count = 0
+        for _ in range(size):
+            self._slots.put_nowait(self._mint())
+
+    def _mint(self) -> str:
+        """在池目录中创建一个新的空文件"""
+        path = os.path.join(self.directory, f"slot_{self._count}")
+        self._count += 1
+        os.close(os.open(path, os.O_RDWR | os.O_CREAT, 0o600))
+        return path
+
+    def acquire(self) -> str:
+        """取出一个空闲文件路径，池为空时新建一个文件，归还后留在池中复用"""
+        try:
+            return self._slots.get_nowait()
+        except asyncio.QueueEmpty:
+            logger.info("Temp file pool exhausted, minting a new slot")
+            return self._mint()
+
+    def release(self, path: str):
+        """将文件交给后台清理协程，清空内容后再归还到池中"""
+        self._cleanup_q.put_nowait(path)
+
+    async def cleanup_worker(self):
+        """后台清理协程：逐个清空归还的文件以释放磁盘空间，需在应用启动时运行"""
+        while True:
+            path = await self._cleanup_q.get()
+            try:
+                os.truncate(path, 0)
+            except FileNotFoundError:
+                # 文件被外部删除时无需清空，下次写入会重新创建
+                pass
+            except OSError as e:
+                logger.warning(f"无法清空临时音频文件 {path}: {e}")
+            self._slots.put_nowait(path)
+
+    def close(self):
+        """删除池目录及其中所有文件"""
+        shutil.rmtree(self.directory, ignore_errors=True)
@@ -0,0 +1,117 @@
+from typing import Iterable
+
+from fastapi.responses import ORJSONResponse
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from ..config import shared_state
+
+# 会携带请求体的方法，其余请求直接放行
+_BODY_METHODS = frozenset({"POST", "PUT", "PATCH"})
+
+
+class UploadLimitMiddleware:
+    """纯 ASGI 中间件：请求体超过上限时返回 413，并停止继续接收上传内容"""
+
+    def __init__(self, app: ASGIApp, max_content_length: int):
+        """
+        初始化中间件
+
+        Args:
+            app: 下游 ASGI 应用
+            max_content_length: 请求体大小上限（字节）
+        """
+        self.app = app
+        self.max_content_length = max_content_length
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] not in _BODY_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        # 声明的大小已超过上限时不读取请求体
+        content_length = Headers(scope=scope).get("content-length")
+        if content_length and content_length.isdigit():
+            if int(content_length) > self.max_content_length:
+                await _too_large(scope, receive, send)
+                return
+
+        # 没有 Content-Length（如分块上传）时边接收边计数
+        received = 0
+        rejected = False
+        response_started = False
+
+        async def limited_receive() -> Message:
+            nonlocal received, rejected
+            message = await receive()
+            if message["type"] == "http.request" and not rejected:
+                received += len(message.get("body", b""))
+                if received > self.max_content_length:
+                    rejected = True
+                    if not response_started:
+                        await _too_large(scope, receive, send)
+                    # 让下游按客户端断开处理，不再读取剩余内容
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message: Message):
+            nonlocal response_started
+            # 已经返回 413 后丢弃下游产生的响应
+            if rejected:
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not rejected:
+                raise
+
+
+class InflightLimitMiddleware:
+    """纯 ASGI 中间件：后台任务已满时在接收上传内容之前直接返回 503"""
+
+    def __init__(self, app: ASGIApp, paths: Iterable[str], max_inflight: int):
+        """
+        初始化中间件
+
+        Args:
+            app: 下游 ASGI 应用
+            paths: 会创建后台任务的接口路径
+            max_inflight: 未结束的后台任务数量上限
+        """
+        self.app = app
+        self.paths = frozenset(paths)
+        self.max_inflight = max_inflight
+        # 已放行但尚未结束的上传请求数，它们的后台任务还没有登记到 background_tasks
+        self._pending = 0
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "POST"
+            or scope["path"] not in self.paths
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        # 检查和占位之间没有 await，并发上传不会同时通过
+        if len(shared_state.background_tasks) + self._pending >= self.max_inflight:
+            response = ORJSONResponse(
+                status_code=503, content={"detail": "服务繁忙，请稍后重试"}
+            )
+            await response(scope, receive, send)
+            return
+        self._pending += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self._pending -= 1
+
+
+async def _too_large(scope: Scope, receive: Receive, send: Send):
+    """返回 413 响应"""
+    response = ORJSONResponse(status_code=413, content={"detail": "文件过大"})
+    await response(scope, receive, send)
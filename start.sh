@@ -67,5 +67,7 @@ echo "日志将输出到 nohup.out 文件"
 echo "要停止服务，请使用 kill 命令或重启系统"
 echo ""
 
-nohup uvicorn src.app:app --host 0.0.0.0 --port $PORT --reload &
+# 任务状态、结果缓存合并和短音频合批都保存在进程内，只能运行单个 worker；
+# 不使用 --reload，避免文件监视进程的额外开销和代码变动时重新加载模型
+nohup uvicorn src.app:app --host 0.0.0.0 --port $PORT --workers 1 --no-access-log &
 echo "服务已启动，进程 ID: $!"
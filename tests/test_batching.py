@@ -0,0 +1,110 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from src.transcription_service import batching
+from src.transcription_service.batching import (
+    SAMPLING_RATE,
+    ShortClipBatcher,
+    _remove_silence,
+    _split_segments,
+)
+
+TIMESTAMP_BEGIN = 1000
+EOT = 900
+
+
+class FakeTokenizer:
+    """只实现 _split_segments 用到的属性，token 即文本中的字符编码"""
+
+    timestamp_begin = TIMESTAMP_BEGIN
+    eot = EOT
+    language_code = "en"
+
+    def decode(self, tokens):
+        return "".join(chr(token) for token in tokens)
+
+
+def _text(value: str):
+    return [ord(char) for char in value]
+
+
+def _time(seconds: float) -> int:
+    return TIMESTAMP_BEGIN + round(seconds / 0.02)
+
+
+def test_split_segments_by_timestamp_tokens():
+    tokens = (
+        [_time(0.0)]
+        + _text(" hello ")
+        + [_time(1.2), _time(1.5)]
+        + _text("world")
+        + [_time(2.4), EOT]
+    )
+    subtitles = _split_segments(FakeTokenizer(), tokens, duration=3.0)
+    assert subtitles == [
+        {"index": 1, "start": 0.0, "end": 1.2, "content": "hello"},
+        {"index": 2, "start": 1.5, "end": 2.4, "content": "world"},
+    ]
+
+
+def test_split_segments_without_final_timestamp_ends_at_duration():
+    tokens = [_time(0.5)] + _text("tail") + [EOT]
+    subtitles = _split_segments(FakeTokenizer(), tokens, duration=2.0)
+    assert subtitles == [{"index": 1, "start": 0.5, "end": 2.0, "content": "tail"}]
+
+
+def test_split_segments_skips_blank_text_and_clamps_end():
+    tokens = [_time(0.0)] + _text("  ") + [_time(1.0)] + _text("x") + [_time(5.0)]
+    subtitles = _split_segments(FakeTokenizer(), tokens, duration=2.0)
+    assert subtitles == [{"index": 1, "start": 1.0, "end": 2.0, "content": "x"}]
+
+
+def test_remove_silence_returns_empty_audio_for_silence():
+    speech, timestamps = _remove_silence(
+        np.zeros(SAMPLING_RATE * 2, dtype=np.float32), None
+    )
+    assert speech.shape[0] == 0
+    assert timestamps is None
+
+
+def test_submit_silent_clip_skips_inference():
+    # model 和 executor 为 None：一旦送入推理就会失败
+    batcher = ShortClipBatcher(model=None, executor=None)
+    silence = np.zeros(SAMPLING_RATE * 2, dtype=np.float32)
+    assert asyncio.run(batcher.submit(silence)) == ([], "en")
+    assert batcher._consumer is None
+
+
+def test_submit_short_clip_restores_original_timestamps(monkeypatch):
+    from faster_whisper.vad import SpeechTimestampsMap
+
+    # 原始音频中 1s~2s 和 3s~4s 为语音，拼接后共 2s
+    chunks = [
+        {"start": SAMPLING_RATE, "end": SAMPLING_RATE * 2},
+        {"start": SAMPLING_RATE * 3, "end": SAMPLING_RATE * 4},
+    ]
+    audio = np.ones(SAMPLING_RATE * 5, dtype=np.float32)
+
+    def remove_silence(audio, vad_parameters):
+        return audio[: SAMPLING_RATE * 2], SpeechTimestampsMap(chunks, SAMPLING_RATE)
+
+    def run_batch(self, items):
+        assert [speech.shape[0] for speech, _ in items] == [SAMPLING_RATE * 2]
+        return [([{"index": 1, "start": 0.5, "end": 1.5, "content": "hi"}], "en")]
+
+    monkeypatch.setattr(batching, "_remove_silence", remove_silence)
+    monkeypatch.setattr(ShortClipBatcher, "_run_batch", run_batch)
+
+    async def main():
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            batcher = ShortClipBatcher(model=None, executor=executor, wait_ms=0)
+            try:
+                return await batcher.submit(audio)
+            finally:
+                batcher._consumer.cancel()
+
+    subtitles, language = asyncio.run(main())
+    assert language == "en"
+    assert subtitles == [{"index": 1, "start": 1.5, "end": 3.5, "content": "hi"}]